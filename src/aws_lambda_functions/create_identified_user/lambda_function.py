@@ -65,7 +65,7 @@ def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[A
     # Get the results of all threads.
     results = {}
     while not queue.empty():
-        results = {**results, **queue.get()}
+        results.update(queue.get())
 
     # Return the results of all threads.
     return results
@@ -136,7 +136,7 @@ def check_input_arguments(**kwargs) -> None:
 
 def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
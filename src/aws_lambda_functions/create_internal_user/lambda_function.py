@@ -4,8 +4,7 @@ import json
 from psycopg2.extras import RealDictCursor
 from functools import wraps
 from typing import *
-from threading import Thread
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import databases
 import utils
 import requests
@@ -31,62 +30,43 @@ POSTGRESQL_CONNECTION = None
 
 
 def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[AnyStr, Any]]]]) -> Dict[AnyStr, Any]:
-    # Create the empty list to save all parallel threads.
-    threads = []
-
-    # Create the queue to store all results of functions.
-    queue = Queue()
-
-    # Create the thread for each function.
-    for function in functions:
-        # Check whether the input arguments have keys in their dictionaries.
-        try:
-            function_object = function["function_object"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-        try:
-            function_arguments = function["function_arguments"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-
-        # Add the instance of the queue to the list of function arguments.
-        function_arguments["queue"] = queue
-
-        # Create the thread.
-        thread = Thread(target=function_object, kwargs=function_arguments)
-        threads.append(thread)
-
-    # Start all parallel threads.
-    for thread in threads:
-        thread.start()
-
-    # Wait until all parallel threads are finished.
-    for thread in threads:
-        thread.join()
-
-    # Get the results of all threads.
-    results = {}
-    while not queue.empty():
-        results = {**results, **queue.get()}
+    # Create the list to save the futures of all parallel threads.
+    futures = []
+
+    # Run each function in the separate thread of the pool.
+    with ThreadPoolExecutor(max_workers=len(functions)) as executor:
+        for function in functions:
+            # Check whether the input arguments have keys in their dictionaries.
+            try:
+                function_object = function["function_object"]
+            except KeyError as error:
+                logger.error(error)
+                raise Exception(error)
+            try:
+                function_arguments = function["function_arguments"]
+            except KeyError as error:
+                logger.error(error)
+                raise Exception(error)
+
+            # Submit the function to the pool.
+            futures.append(executor.submit(function_object, **function_arguments))
+
+        # Get the results of all threads. The exception of the failed function is raised here.
+        results = {}
+        for future in as_completed(futures):
+            results.update(future.result())
 
     # Return the results of all threads.
     return results
 
 
-def check_input_arguments(**kwargs) -> None:
+def check_input_arguments(**kwargs) -> Dict[AnyStr, Any]:
     # Make sure that all the necessary arguments for the AWS Lambda function are present.
     try:
         input_arguments = kwargs["event"]["arguments"]["input"]
     except KeyError as error:
         logger.error(error)
         raise Exception(error)
-    try:
-        queue = kwargs["queue"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
 
     # Check the format and values of required arguments in the list of input arguments.
     required_arguments = ["userPrimaryEmail", "password"]
@@ -116,8 +96,8 @@ def check_input_arguments(**kwargs) -> None:
             ) for phone_number in input_arguments["userSecondaryPhoneNumber"]
         ]
 
-    # Put the result of the function in the queue.
-    queue.put({
+    # Return the formatted input arguments.
+    return {
         "input_arguments": {
             "auth0_user_id": input_arguments.get("auth0UserId", None),
             "auth0_metadata": json.dumps(input_arguments.get("auth0Metadata", None)),
@@ -135,15 +115,12 @@ def check_input_arguments(**kwargs) -> None:
             "organization_id": input_arguments.get("organizationId", None),
             "password": input_arguments["password"]
         }
-    })
-
-    # Return nothing.
-    return None
+    }
 
 
-def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
+def reuse_or_recreate_postgresql_connection() -> Dict[AnyStr, Any]:
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
@@ -155,18 +132,10 @@ def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
         except Exception as error:
             logger.error(error)
             raise Exception("Unable to connect to the PostgreSQL database.")
-    queue.put({"postgresql_connection": POSTGRESQL_CONNECTION})
-    return None
-
+    return {"postgresql_connection": POSTGRESQL_CONNECTION}
 
-def get_access_token_from_auth0(**kwargs) -> None:
-    # Check if the input dictionary has all the necessary keys.
-    try:
-        queue = kwargs["queue"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
 
+def get_access_token_from_auth0() -> Dict[AnyStr, Any]:
     # Create the request URL address.
     request_url = "{0}oauth/token".format(AUTH0_DOMAIN)
 
@@ -191,13 +160,10 @@ def get_access_token_from_auth0(**kwargs) -> None:
         logger.error(error)
         raise Exception(error)
 
-    # Put the result of the function in the queue.
-    queue.put({
+    # Return the access token.
+    return {
         "access_token": response.json().get("access_token", None)
-    })
-
-    # Return nothing.
-    return None
+    }
 
 
 def create_user_in_auth0(**kwargs) -> Any:
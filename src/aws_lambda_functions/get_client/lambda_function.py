@@ -64,7 +64,7 @@ def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[A
     # Get the results of all threads.
     results = {}
     while not queue.empty():
-        results = {**results, **queue.get()}
+        results.update(queue.get())
 
     # Return the results of all threads.
     return results
@@ -109,7 +109,7 @@ def check_input_arguments(**kwargs) -> None:
 
 def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
@@ -121,6 +121,9 @@ def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
         except Exception as error:
             logger.error(error)
             raise Exception("Unable to connect to the PostgreSQL database.")
+
+        # The databases layer already returns connections in autocommit mode, so this only makes it explicit.
+        POSTGRESQL_CONNECTION.autocommit = True
     queue.put({"postgresql_connection": POSTGRESQL_CONNECTION})
     return None
 
@@ -1,13 +1,11 @@
 import logging
 import os
-import uuid
-from psycopg2.extras import RealDictCursor
+import re
+import base64
+import binascii
 from functools import wraps
 from typing import *
-from threading import Thread
-from queue import Queue
 import databases
-import utils
 
 # Configure the logging tool in the AWS Lambda function.
 logger = logging.getLogger(__name__)
@@ -20,98 +18,217 @@ POSTGRESQL_HOST = os.environ["POSTGRESQL_HOST"]
 POSTGRESQL_PORT = int(os.environ["POSTGRESQL_PORT"])
 POSTGRESQL_DB_NAME = os.environ["POSTGRESQL_DB_NAME"]
 
+# The compiled pattern of the UUID format that is used to validate input arguments.
+UUID_PATTERN = re.compile(r"\A[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\Z")
+
 # The connection to the database will be created the first time the AWS Lambda function is called.
 # Any subsequent call to the function will use the same database connection until the container stops.
 POSTGRESQL_CONNECTION = None
 
-
-def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[AnyStr, Any]]]]) -> Dict[AnyStr, Any]:
-    # Create the empty list to save all parallel threads.
-    threads = []
-
-    # Create the queue to store all results of functions.
-    queue = Queue()
-
-    # Create the thread for each function.
-    for function in functions:
-        # Check whether the input arguments have keys in their dictionaries.
-        try:
-            function_object = function["function_object"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-        try:
-            function_arguments = function["function_arguments"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-
-        # Add the instance of the queue to the list of function arguments.
-        function_arguments["queue"] = queue
-
-        # Create the thread.
-        thread = Thread(target=function_object, kwargs=function_arguments)
-        threads.append(thread)
-
-    # Start all parallel threads.
-    for thread in threads:
-        thread.start()
-
-    # Wait until all parallel threads are finished.
-    for thread in threads:
-        thread.join()
-
-    # Get the results of all threads.
-    results = {}
-    while not queue.empty():
-        results = {**results, **queue.get()}
-
-    # Return the results of all threads.
-    return results
-
-
-def check_input_arguments(**kwargs) -> None:
+# The cursor is opened on the cached connection once and reused by all the queries of the warm container.
+POSTGRESQL_CURSOR = None
+
+# The names of the client's fields in the order of the columns returned by the clients query.
+# The last column contains the gender id which is replaced with the gender object.
+CLIENTS_COLUMNS = (
+    "userId",
+    "userNickname",
+    "userProfilePhotoUrl",
+    "userType",
+    "createdDateTime",
+    "userFirstName",
+    "userLastName",
+    "userMiddleName",
+    "userPrimaryEmail",
+    "userSecondaryEmail",
+    "userPrimaryPhoneNumber",
+    "userSecondaryPhoneNumber",
+    "metadata",
+    "telegramUsername",
+    "whatsappProfile",
+    "whatsappUsername",
+    "instagramPrivateUsername",
+    "vkUserId",
+    "instagramProfile",
+    "gender"
+)
+
+# The names of the gender's fields in the order of the columns returned by the genders query.
+GENDER_COLUMNS = (
+    "genderId",
+    "genderTechnicalName",
+    "genderPublicName"
+)
+
+# The genders dictionary is small and rarely changes, so it is cached in the container and keyed by gender id.
+# It is reloaded when a client refers to a gender that was added after the dictionary was loaded.
+GENDERS = None
+
+# The SQL request that returns the list of clients who have interacted with the company.
+# The clients are deduplicated by their ids first, so the wide rows don't need to be sorted.
+# The identified user is joined only when the client is identified, so its columns are null otherwise.
+# The filter by active clients can use the partial index:
+# "create index concurrently users_active_clients_idx on users (user_id)
+# where entry_deleted_date_time is null and internal_user_id is null;".
+# The joins of the organization filter can use the indexes:
+# "create index concurrently chat_rooms_channel_id_idx on chat_rooms (channel_id);",
+# "create index concurrently organizations_root_organization_id_idx on organizations (root_organization_id);".
+CLIENTS_SQL_STATEMENT = """
+with clients_ids as (
+    select
+        distinct chat_rooms_users_relationship.user_id
+    from
+        chat_rooms_users_relationship
+    inner join chat_rooms on
+        chat_rooms_users_relationship.chat_room_id = chat_rooms.chat_room_id
+    inner join channels_organizations_relationship on
+        chat_rooms.channel_id = channels_organizations_relationship.channel_id
+    inner join organizations on
+        channels_organizations_relationship.organization_id = organizations.organization_id
+    where
+        organizations.organization_id = %(root_organization_id)s
+    or
+        organizations.root_organization_id = %(root_organization_id)s
+)
+select
+    users.user_id::text,
+    users.user_nickname::text,
+    users.user_profile_photo_url::text,
+    case
+        when identified_users.identified_user_id is not null
+        then 'identified_user'::text
+        else 'unidentified_user'::text
+    end as user_type,
+    users.entry_created_date_time::text as created_date_time,
+    identified_users.identified_user_first_name::text as user_first_name,
+    identified_users.identified_user_last_name::text as user_last_name,
+    identified_users.identified_user_middle_name::text as user_middle_name,
+    identified_users.identified_user_primary_email::text as user_primary_email,
+    identified_users.identified_user_secondary_email::text[] as user_secondary_email,
+    identified_users.identified_user_primary_phone_number::text as user_primary_phone_number,
+    identified_users.identified_user_secondary_phone_number::text[] as user_secondary_phone_number,
+    coalesce(identified_users.metadata::text, unidentified_users.metadata::text) as metadata,
+    identified_users.telegram_username::text,
+    identified_users.whatsapp_profile::text,
+    identified_users.whatsapp_username::text,
+    identified_users.instagram_private_username::text,
+    identified_users.vk_user_id::text,
+    identified_users.instagram_profile::text,
+    identified_users.gender_id::text
+from
+    clients_ids
+inner join users on
+    clients_ids.user_id = users.user_id
+left join identified_users on
+    users.identified_user_id = identified_users.identified_user_id
+and
+    users.unidentified_user_id is null
+left join unidentified_users on
+    users.unidentified_user_id = unidentified_users.unidentified_user_id
+where
+    users.entry_deleted_date_time is null
+and
+    users.internal_user_id is null
+and
+    (users.unidentified_user_id is not null or users.identified_user_id is not null)
+and
+    (%(last_user_id)s::uuid is null or users.user_id > %(last_user_id)s::uuid)
+order by
+    users.user_id
+offset %(offset)s limit %(limit)s;
+"""
+
+# The SQL request that returns the total count of clients who have interacted with the company.
+# It is the heaviest query of the function, so it is prepared once per connection and then only executed.
+PREPARE_CLIENTS_COUNT_SQL_STATEMENT = """
+prepare get_clients_count (uuid) as
+with clients_ids as (
+    select
+        distinct chat_rooms_users_relationship.user_id
+    from
+        chat_rooms_users_relationship
+    inner join chat_rooms on
+        chat_rooms_users_relationship.chat_room_id = chat_rooms.chat_room_id
+    inner join channels_organizations_relationship on
+        chat_rooms.channel_id = channels_organizations_relationship.channel_id
+    inner join organizations on
+        channels_organizations_relationship.organization_id = organizations.organization_id
+    where
+        organizations.organization_id = $1
+    or
+        organizations.root_organization_id = $1
+)
+select
+    count(*) as total_items_count
+from
+    clients_ids
+inner join users on
+    clients_ids.user_id = users.user_id
+where
+    users.entry_deleted_date_time is null
+and
+    users.internal_user_id is null
+and
+    (users.unidentified_user_id is not null or users.identified_user_id is not null);
+"""
+
+# The connection on which the count of clients is prepared.
+CLIENTS_COUNT_PREPARED_CONNECTION = None
+
+# The SQL request that returns the list of genders.
+GENDERS_SQL_STATEMENT = """
+select
+    gender_id::text,
+    gender_technical_name::text,
+    gender_public_name::text
+from
+    genders;
+"""
+
+
+def check_input_arguments(**kwargs) -> Dict[AnyStr, Any]:
     # Make sure that all the necessary arguments for the AWS Lambda function are present.
     try:
         input_arguments = kwargs["event"]["arguments"]
     except KeyError as error:
         logger.error(error)
         raise Exception(error)
-    try:
-        queue = kwargs["queue"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
 
     # Check the format and values of required arguments in the list of input arguments.
     required_arguments = ["rootOrganizationId", "itemsCountPerPage", "currentPageNumber"]
+    optional_arguments = ["pageCursor", "totalItemsCount"]
     for argument_name, argument_value in input_arguments.items():
-        if argument_name not in required_arguments:
+        if argument_name not in required_arguments and argument_name not in optional_arguments:
             raise Exception("The '{0}' argument doesn't exist.".format(argument_name))
-        if argument_value is None:
+        if argument_value is None and argument_name not in optional_arguments:
             raise Exception("The '{0}' argument can't be None/Null/Undefined.".format(argument_name))
         if argument_name == "rootOrganizationId":
-            try:
-                uuid.UUID(argument_value)
-            except ValueError:
+            if not isinstance(argument_value, str) or not UUID_PATTERN.match(argument_value):
                 raise Exception("The '{0}' argument format is not UUID.".format(argument_name))
 
-    # Put the result of the function in the queue.
-    queue.put({
-        "input_arguments": {
-            "root_organization_id": input_arguments["rootOrganizationId"],
-            "items_count_per_page": input_arguments["itemsCountPerPage"],
-            "current_page_number": input_arguments["currentPageNumber"]
-        }
-    })
+    # The page cursor is the base64 encoded id of the last client of the previous page.
+    last_user_id = None
+    if input_arguments.get("pageCursor", None) is not None:
+        try:
+            last_user_id = base64.urlsafe_b64decode(input_arguments["pageCursor"]).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise Exception("The 'pageCursor' argument format is incorrect.")
+        if not UUID_PATTERN.match(last_user_id):
+            raise Exception("The 'pageCursor' argument format is incorrect.")
 
-    # Return nothing.
-    return None
+    # Return the formatted input arguments.
+    return {
+        "root_organization_id": input_arguments["rootOrganizationId"],
+        "items_count_per_page": input_arguments["itemsCountPerPage"],
+        "current_page_number": input_arguments["currentPageNumber"],
+        "last_user_id": last_user_id,
+        "total_items_count": input_arguments.get("totalItemsCount", None)
+    }
 
 
-def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
+def reuse_or_recreate_postgresql_connection():
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
@@ -123,28 +240,37 @@ def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
         except Exception as error:
             logger.error(error)
             raise Exception("Unable to connect to the PostgreSQL database.")
-    queue.put({"postgresql_connection": POSTGRESQL_CONNECTION})
-    return None
+
+        # The databases layer already returns connections in autocommit mode, so this only makes it explicit.
+        POSTGRESQL_CONNECTION.autocommit = True
+    return POSTGRESQL_CONNECTION
 
 
 def postgresql_wrapper(function):
     @wraps(function)
     def wrapper(**kwargs):
+        global POSTGRESQL_CONNECTION, POSTGRESQL_CURSOR
         try:
             postgresql_connection = kwargs["postgresql_connection"]
         except KeyError as error:
             logger.error(error)
             raise Exception(error)
-        cursor = postgresql_connection.cursor(cursor_factory=RealDictCursor)
-        kwargs["cursor"] = cursor
-        result = function(**kwargs)
-        cursor.close()
+        if POSTGRESQL_CURSOR is None or POSTGRESQL_CURSOR.connection is not postgresql_connection:
+            POSTGRESQL_CURSOR = postgresql_connection.cursor()
+        kwargs["cursor"] = POSTGRESQL_CURSOR
+        try:
+            result = function(**kwargs)
+        except Exception:
+            # Forget the broken connection so that the next call of the warm container creates a new one.
+            if postgresql_connection.closed:
+                POSTGRESQL_CONNECTION, POSTGRESQL_CURSOR = None, None
+            raise
         return result
     return wrapper
 
 
 @postgresql_wrapper
-def get_clients_data(**kwargs) -> List[Dict[AnyStr, Any]]:
+def get_clients_data(**kwargs) -> List[Tuple[Any, ...]]:
     # Check if the input dictionary has all the necessary keys.
     try:
         cursor = kwargs["cursor"]
@@ -157,139 +283,9 @@ def get_clients_data(**kwargs) -> List[Dict[AnyStr, Any]]:
         logger.error(error)
         raise Exception(error)
 
-    # Prepare the SQL request that returns the list of clients who have interacted with the company.
-    sql_statement = """
-    select
-        count(*) over() as total_items_count,
-        aggregated_data.*
-    from (
-        select
-            distinct users.user_id::text,
-            users.user_nickname::text,
-            users.user_profile_photo_url::text,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then 'identified_user'::text
-                else 'unidentified_user'::text
-            end as user_type,
-            users.entry_created_date_time::text as created_date_time,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.identified_user_first_name::text
-                else null
-            end as user_first_name,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.identified_user_last_name::text
-                else null
-            end as user_last_name,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.identified_user_middle_name::text
-                else null
-            end as user_middle_name,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.identified_user_primary_email::text
-                else null
-            end as user_primary_email,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.identified_user_secondary_email::text[]
-                else null
-            end as user_secondary_email,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.identified_user_primary_phone_number::text
-                else null
-            end as user_primary_phone_number,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.identified_user_secondary_phone_number::text[]
-                else null
-            end as user_secondary_phone_number,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.metadata::text
-                else unidentified_users.metadata::text
-            end as metadata,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.telegram_username::text
-                else null
-            end as telegram_username,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.whatsapp_profile::text
-                else null
-            end as whatsapp_profile,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.whatsapp_username::text
-                else null
-            end as whatsapp_username,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.instagram_private_username::text
-                else null
-            end as instagram_private_username,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.vk_user_id::text
-                else null
-            end as vk_user_id,
-            case
-                when users.identified_user_id is not null and users.unidentified_user_id is null
-                then identified_users.instagram_profile::text
-                else null
-            end as instagram_profile,
-            genders.gender_id::text,
-            genders.gender_technical_name::text,
-            genders.gender_public_name::text
-        from
-            chat_rooms_users_relationship
-        left join users on
-            chat_rooms_users_relationship.user_id = users.user_id
-        left join identified_users on
-            users.identified_user_id = identified_users.identified_user_id
-        left join unidentified_users on
-            users.unidentified_user_id = unidentified_users.unidentified_user_id
-        left join genders on
-            identified_users.gender_id = genders.gender_id
-        where
-            users.entry_deleted_date_time is null
-        and
-            users.internal_user_id is null
-        and 
-            (users.unidentified_user_id is not null or users.identified_user_id is not null)
-        and
-            chat_rooms_users_relationship.chat_room_id in (
-                select
-                    chat_rooms.chat_room_id
-                from
-                    chat_rooms
-                where
-                    chat_rooms.channel_id in (
-                        select
-                            channels_organizations_relationship.channel_id
-                        from
-                            channels_organizations_relationship
-                        left join organizations on
-                            channels_organizations_relationship.organization_id = organizations.organization_id
-                        where
-                            organizations.organization_id = %(root_organization_id)s
-                        or
-                            organizations.root_organization_id = %(root_organization_id)s
-                    )
-            )
-        order by
-            users.user_id::text
-    ) as aggregated_data offset %(offset)s limit %(limit)s;
-    """
-
     # Execute the SQL query dynamically, in a convenient and safe way.
     try:
-        cursor.execute(sql_statement, sql_arguments)
+        cursor.execute(CLIENTS_SQL_STATEMENT, sql_arguments)
     except Exception as error:
         logger.error(error)
         raise Exception(error)
@@ -298,6 +294,61 @@ def get_clients_data(**kwargs) -> List[Dict[AnyStr, Any]]:
     return cursor.fetchall()
 
 
+@postgresql_wrapper
+def get_clients_count(**kwargs) -> int:
+    # Check if the input dictionary has all the necessary keys.
+    try:
+        cursor = kwargs["cursor"]
+    except KeyError as error:
+        logger.error(error)
+        raise Exception(error)
+    try:
+        sql_arguments = kwargs["sql_arguments"]
+    except KeyError as error:
+        logger.error(error)
+        raise Exception(error)
+
+    # Prepare the SQL request only once for the current connection.
+    global CLIENTS_COUNT_PREPARED_CONNECTION
+    if CLIENTS_COUNT_PREPARED_CONNECTION is not cursor.connection:
+        try:
+            cursor.execute(PREPARE_CLIENTS_COUNT_SQL_STATEMENT)
+        except Exception as error:
+            logger.error(error)
+            raise Exception(error)
+        CLIENTS_COUNT_PREPARED_CONNECTION = cursor.connection
+
+    # Execute the prepared SQL query dynamically, in a convenient and safe way.
+    try:
+        cursor.execute("execute get_clients_count (%(root_organization_id)s);", sql_arguments)
+    except Exception as error:
+        logger.error(error)
+        raise Exception(error)
+
+    # Return the total count of clients.
+    return cursor.fetchone()[0]
+
+
+@postgresql_wrapper
+def get_genders_data(**kwargs) -> Dict[AnyStr, Dict[AnyStr, Any]]:
+    # Check if the input dictionary has all the necessary keys.
+    try:
+        cursor = kwargs["cursor"]
+    except KeyError as error:
+        logger.error(error)
+        raise Exception(error)
+
+    # Execute the SQL query dynamically, in a convenient and safe way.
+    try:
+        cursor.execute(GENDERS_SQL_STATEMENT)
+    except Exception as error:
+        logger.error(error)
+        raise Exception(error)
+
+    # Return the genders by their ids.
+    return {record[0]: dict(zip(GENDER_COLUMNS, record)) for record in cursor.fetchall()}
+
+
 def analyze_and_format_clients_data(**kwargs) -> Any:
     # Check if the input dictionary has all the necessary keys.
     try:
@@ -305,27 +356,21 @@ def analyze_and_format_clients_data(**kwargs) -> Any:
     except KeyError as error:
         logger.error(error)
         raise Exception(error)
+    try:
+        genders = kwargs["genders"]
+    except KeyError as error:
+        logger.error(error)
+        raise Exception(error)
+
+    # Format the clients data. The nested gender object is taken from the cached genders by the last column.
+    empty_gender = {"genderId": None, "genderTechnicalName": None, "genderPublicName": None}
+    clients = [
+        dict(zip(CLIENTS_COLUMNS, record), gender=genders.get(record[-1], empty_gender))
+        for record in clients_data
+    ]
 
-    # Format the clients data.
-    clients = []
-    total_items_count = 0
-    if clients_data is not None:
-        for index, record in enumerate(clients_data):
-            client, gender = {}, {}
-            for key, value in record.items():
-                if key == "total_number_of_users":
-                    break
-                elif key.startswith("gender_"):
-                    gender[utils.camel_case(key)] = value
-                else:
-                    client[utils.camel_case(key)] = value
-            client["gender"] = gender
-            clients.append(client)
-            if index == 0:
-                total_items_count = record["total_items_count"]
-
-    # Return the clients and the total count of items.
-    return clients, total_items_count
+    # Return the clients.
+    return clients
 
 
 def lambda_handler(event, context):
@@ -333,28 +378,16 @@ def lambda_handler(event, context):
     :param event: The AWS Lambda function uses this parameter to pass in event data to the handler.
     :param context: The AWS Lambda function uses this parameter to provide runtime information to your handler.
     """
-    # Run several initialization functions in parallel.
-    results_of_tasks = run_multithreading_tasks([
-        {
-            "function_object": check_input_arguments,
-            "function_arguments": {
-                "event": event
-            }
-        },
-        {
-            "function_object": reuse_or_recreate_postgresql_connection,
-            "function_arguments": {}
-        }
-    ])
-
     # Define the input arguments of the AWS Lambda function.
-    input_arguments = results_of_tasks["input_arguments"]
+    input_arguments = check_input_arguments(event=event)
     root_organization_id = input_arguments["root_organization_id"]
     items_count_per_page = input_arguments["items_count_per_page"]
     current_page_number = input_arguments["current_page_number"]
+    last_user_id = input_arguments["last_user_id"]
+    total_items_count = input_arguments["total_items_count"]
 
     # Define the instances of the database connections.
-    postgresql_connection = results_of_tasks["postgresql_connection"]
+    postgresql_connection = reuse_or_recreate_postgresql_connection()
 
     # Get a list of clients who have interacted with the company.
     clients_data = get_clients_data(
@@ -362,12 +395,32 @@ def lambda_handler(event, context):
         sql_arguments={
             "root_organization_id": root_organization_id,
             "limit": items_count_per_page,
-            "offset": (current_page_number - 1) * items_count_per_page
+            "offset": 0 if last_user_id else (current_page_number - 1) * items_count_per_page,
+            "last_user_id": last_user_id
         }
     )
 
-    # Define variables that stores formatted information.
-    clients, total_items_count = analyze_and_format_clients_data(clients_data=clients_data)
+    # Load the genders the first time the AWS Lambda function is called or when the cached genders miss an id.
+    global GENDERS
+    if GENDERS is None or any(record[-1] is not None and record[-1] not in GENDERS for record in clients_data):
+        GENDERS = get_genders_data(postgresql_connection=postgresql_connection)
+
+    # Count the clients on the first page only, the next pages reuse the count sent back by the client.
+    if current_page_number == 1 or total_items_count is None:
+        total_items_count = get_clients_count(
+            postgresql_connection=postgresql_connection,
+            sql_arguments={
+                "root_organization_id": root_organization_id
+            }
+        )
+
+    # Define variable that stores formatted information.
+    clients = analyze_and_format_clients_data(clients_data=clients_data, genders=GENDERS)
+
+    # The cursor of the next page is defined only when the current page is full.
+    next_page_cursor = None
+    if len(clients_data) == items_count_per_page:
+        next_page_cursor = base64.urlsafe_b64encode(clients[-1]["userId"].encode("utf-8")).decode("utf-8")
 
     # Return the full information about the clients as the response.
     return {
@@ -375,6 +428,7 @@ def lambda_handler(event, context):
         "pageInformation": {
             "currentPageNumber": current_page_number,
             "itemsCountPerPage": items_count_per_page,
-            "totalItemsCount": total_items_count
+            "totalItemsCount": total_items_count,
+            "nextPageCursor": next_page_cursor
         }
     }
@@ -1,7 +1,6 @@
 import logging
 import os
 import uuid
-from psycopg2.extras import RealDictCursor
 from functools import wraps
 from typing import *
 from threading import Thread
@@ -24,6 +23,10 @@ POSTGRESQL_DB_NAME = os.environ["POSTGRESQL_DB_NAME"]
 # Any subsequent call to the function will use the same database connection until the container stops.
 POSTGRESQL_CONNECTION = None
 
+# The columns of the SQL query are the same in every invocation, so the camel case names of the keys of each nested
+# object and the slice of its columns are defined the first time the AWS Lambda function is called.
+INTERNAL_USERS_SCHEMA = None
+
 
 def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[AnyStr, Any]]]]) -> Dict[AnyStr, Any]:
     # Create the empty list to save all parallel threads.
@@ -64,7 +67,7 @@ def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[A
     # Get the results of all threads.
     results = {}
     while not queue.empty():
-        results = {**results, **queue.get()}
+        results.update(queue.get())
 
     # Return the results of all threads.
     return results
@@ -111,7 +114,7 @@ def check_input_arguments(**kwargs) -> None:
 
 def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
@@ -123,10 +126,23 @@ def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
         except Exception as error:
             logger.error(error)
             raise Exception("Unable to connect to the PostgreSQL database.")
+
+        # The databases layer already returns connections in autocommit mode, so this only makes it explicit.
+        POSTGRESQL_CONNECTION.autocommit = True
     queue.put({"postgresql_connection": POSTGRESQL_CONNECTION})
     return None
 
 
+def define_object_name_and_key(key: AnyStr) -> Tuple[AnyStr, AnyStr]:
+    if key.startswith("gender_"):
+        return "gender", utils.camel_case(key)
+    if key.startswith("role_"):
+        return "role", utils.camel_case(key)
+    if "organization_" in key:
+        return "organization", utils.camel_case(key)
+    return "internal_user", utils.camel_case(key)
+
+
 def postgresql_wrapper(function):
     @wraps(function)
     def wrapper(**kwargs):
@@ -135,7 +151,7 @@ def postgresql_wrapper(function):
         except KeyError as error:
             logger.error(error)
             raise Exception(error)
-        cursor = postgresql_connection.cursor(cursor_factory=RealDictCursor)
+        cursor = postgresql_connection.cursor()
         kwargs["cursor"] = cursor
         result = function(**kwargs)
         cursor.close()
@@ -144,7 +160,7 @@ def postgresql_wrapper(function):
 
 
 @postgresql_wrapper
-def get_internal_users_data(**kwargs) -> List[Dict[AnyStr, Any]]:
+def get_internal_users_data(**kwargs) -> List[Tuple]:
     # Check if the input dictionary has all the necessary keys.
     try:
         cursor = kwargs["cursor"]
@@ -160,9 +176,9 @@ def get_internal_users_data(**kwargs) -> List[Dict[AnyStr, Any]]:
     # Prepare the SQL request that returns the list of internal users who have interacted with the company.
     sql_statement = """
     select
+        count(*) over() as total_items_count,
         users.entry_created_date_time::text as created_date_time,
         users.entry_deleted_date_time::text as deleted_date_time,
-        count(*) over() as total_items_count,
         internal_users.auth0_user_id::text,
         internal_users.auth0_metadata::text,
         users.user_id::text,
@@ -220,6 +236,23 @@ def get_internal_users_data(**kwargs) -> List[Dict[AnyStr, Any]]:
         logger.error(error)
         raise Exception(error)
 
+    # Define the keys of each nested object and the slice of its columns. The SQL request lists them one after another.
+    # The first column is the total count of items, which is returned once in the page information, not per user.
+    global INTERNAL_USERS_SCHEMA
+    if INTERNAL_USERS_SCHEMA is None:
+        schema = {}
+        for position, column in enumerate(cursor.description[1:], start=1):
+            object_name, key = define_object_name_and_key(column.name)
+            keys, positions = schema.setdefault(object_name, ([], []))
+            if positions and positions[-1] != position - 1:
+                raise Exception("The columns of the '{0}' object must be consecutive.".format(object_name))
+            keys.append(key)
+            positions.append(position)
+        INTERNAL_USERS_SCHEMA = {
+            object_name: (tuple(keys), slice(positions[0], positions[-1] + 1))
+            for object_name, (keys, positions) in schema.items()
+        }
+
     # Return the list of internal users who have interacted with the company.
     return cursor.fetchall()
 
@@ -232,29 +265,22 @@ def analyze_and_format_internal_users_data(**kwargs) -> Any:
         logger.error(error)
         raise Exception(error)
 
-    # Format the internal users data.
+    # The total count of items is the same in every record, so take it from the first column of the first one.
+    total_items_count = internal_users_data[0][0] if internal_users_data else 0
+
+    # Format the internal users data. Each object is built at once from its keys and the slice of its columns.
     internal_users = []
-    total_items_count = 0
-    if internal_users_data is not None:
-        for index, record in enumerate(internal_users_data):
-            internal_user, gender, role, organization = {}, {}, {}, {}
-            for key, value in record.items():
-                if key == "total_number_of_users":
-                    break
-                elif key.startswith("gender_"):
-                    gender[utils.camel_case(key)] = value
-                elif key.startswith("role_"):
-                    role[utils.camel_case(key)] = value
-                elif "organization_" in key:
-                    organization[utils.camel_case(key)] = value
-                else:
-                    internal_user[utils.camel_case(key)] = value
-            internal_user["gender"] = gender
-            internal_user["role"] = role
-            internal_user["organization"] = organization
+    if internal_users_data:
+        internal_user_keys, internal_user_columns = INTERNAL_USERS_SCHEMA["internal_user"]
+        gender_keys, gender_columns = INTERNAL_USERS_SCHEMA["gender"]
+        role_keys, role_columns = INTERNAL_USERS_SCHEMA["role"]
+        organization_keys, organization_columns = INTERNAL_USERS_SCHEMA["organization"]
+        for record in internal_users_data:
+            internal_user = dict(zip(internal_user_keys, record[internal_user_columns]))
+            internal_user["gender"] = dict(zip(gender_keys, record[gender_columns]))
+            internal_user["role"] = dict(zip(role_keys, record[role_columns]))
+            internal_user["organization"] = dict(zip(organization_keys, record[organization_columns]))
             internal_users.append(internal_user)
-            if index == 0:
-                total_items_count = record["total_items_count"]
 
     # Return the internal users and the total count of items.
     return internal_users, total_items_count
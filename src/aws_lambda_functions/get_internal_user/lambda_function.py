@@ -1,10 +1,10 @@
 import logging
 import os
+import time
 from psycopg2.extras import RealDictCursor
-from functools import wraps
+from functools import wraps, lru_cache
 from typing import *
-from threading import Thread
-from queue import Queue
+from collections import OrderedDict
 import databases
 import utils
 
@@ -23,87 +23,111 @@ POSTGRESQL_DB_NAME = os.environ["POSTGRESQL_DB_NAME"]
 # Any subsequent call to the function will use the same database connection until the container stops.
 POSTGRESQL_CONNECTION = None
 
-
-def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[AnyStr, Any]]]]) -> Dict[AnyStr, Any]:
-    # Create the empty list to save all parallel threads.
-    threads = []
-
-    # Create the queue to store all results of functions.
-    queue = Queue()
-
-    # Create the thread for each function.
-    for function in functions:
-        # Check whether the input arguments have keys in their dictionaries.
-        try:
-            function_object = function["function_object"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-        try:
-            function_arguments = function["function_arguments"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-
-        # Add the instance of the queue to the list of function arguments.
-        function_arguments["queue"] = queue
-
-        # Create the thread.
-        thread = Thread(target=function_object, kwargs=function_arguments)
-        threads.append(thread)
-
-    # Start all parallel threads.
-    for thread in threads:
-        thread.start()
-
-    # Wait until all parallel threads are finished.
-    for thread in threads:
-        thread.join()
-
-    # Get the results of all threads.
-    results = {}
-    while not queue.empty():
-        results = {**results, **queue.get()}
-
-    # Return the results of all threads.
-    return results
-
-
-def check_input_arguments(**kwargs) -> None:
+# The information of the internal user changes rarely, so keep it in the container for a short time.
+# The cache isn't invalidated, and the role and the organization of the internal user are used for authorization,
+# so a change or a deletion of the internal user can be missed by a warm container for up to the TTL (in seconds).
+# The cache stores the time of the request and the immutable copy of the record by the Auth0 user ID.
+INTERNAL_USERS_CACHE = OrderedDict()
+INTERNAL_USERS_CACHE_TTL = 5
+INTERNAL_USERS_CACHE_MAX_SIZE = 512
+
+# The SQL request that returns information about the internal user.
+# It is executed on every call of the warm container, so it is prepared once per connection and then only executed.
+# The type of the parameter is inferred from the type of the "auth0_user_id" column.
+PREPARE_INTERNAL_USER_SQL_STATEMENT = """
+prepare get_internal_user as
+select
+    internal_users.auth0_user_id::text,
+    internal_users.auth0_metadata::text,
+    users.user_id::text,
+    users.user_nickname::text,
+    users.user_profile_photo_url::text,
+    internal_users.internal_user_first_name::text as user_first_name,
+    internal_users.internal_user_last_name::text as user_last_name,
+    internal_users.internal_user_middle_name::text as user_middle_name,
+    internal_users.internal_user_primary_email::text as user_primary_email,
+    internal_users.internal_user_secondary_email::text[] as user_secondary_email,
+    internal_users.internal_user_primary_phone_number::text as user_primary_phone_number,
+    internal_users.internal_user_secondary_phone_number::text[] as user_secondary_phone_number,
+    internal_users.internal_user_position_name::text as user_position_name,
+    genders.gender_id::text,
+    genders.gender_technical_name::text,
+    genders.gender_public_name::text,
+    roles.role_id::text,
+    roles.role_technical_name::text,
+    roles.role_public_name::text,
+    roles.role_description::text,
+    organizations.organization_id::text,
+    organizations.organization_name::text,
+    organizations.organization_level::smallint,
+    organizations.parent_organization_id::text,
+    organizations.parent_organization_name::text,
+    organizations.parent_organization_level::smallint,
+    organizations.root_organization_id::text,
+    organizations.root_organization_name::text,
+    organizations.root_organization_level::smallint,
+    organizations.tree_organization_id::text,
+    organizations.tree_organization_name::text
+from
+    users
+left join internal_users on
+    users.internal_user_id = internal_users.internal_user_id
+left join genders on
+    internal_users.gender_id = genders.gender_id
+left join roles on
+    internal_users.role_id = roles.role_id
+left join organizations on
+    internal_users.organization_id = organizations.organization_id
+where
+    internal_users.auth0_user_id = $1
+and
+    users.internal_user_id is not null
+limit 1;
+"""
+
+# The connection on which the information about the internal user is prepared.
+INTERNAL_USER_PREPARED_CONNECTION = None
+
+
+# The column names are the same in every invocation, so define the nested object and the camel case name of each of
+# them only once per container.
+@lru_cache(maxsize=256)
+def define_object_name_and_key(key: AnyStr) -> Tuple[AnyStr, AnyStr]:
+    if key.startswith("gender_"):
+        return "gender", utils.camel_case(key)
+    if key.startswith("role_"):
+        return "role", utils.camel_case(key)
+    if "organization_" in key:
+        return "organization", utils.camel_case(key)
+    return "internal_user", utils.camel_case(key)
+
+
+def check_input_arguments(**kwargs) -> Dict:
     # Make sure that all the necessary arguments for the AWS Lambda function are present.
     try:
         input_arguments = kwargs["event"]["arguments"]
     except KeyError as error:
         logger.error(error)
         raise Exception(error)
-    try:
-        queue = kwargs["queue"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
 
     # Check the format and values of required arguments in the list of input arguments.
-    required_arguments = ["auth0UserId"]
-    for argument_name, argument_value in input_arguments.items():
-        if argument_name not in required_arguments:
-            raise Exception("The '{0}' argument doesn't exist.".format(argument_name))
-        if argument_value is None:
-            raise Exception("The '{0}' argument can't be None/Null/Undefined.".format(argument_name))
-
-    # Put the result of the function in the queue.
-    queue.put({
-        "input_arguments": {
-            "auth0_user_id": input_arguments["auth0UserId"]
-        }
-    })
+    required_arguments = {"auth0UserId"}
+    unknown_arguments = set(input_arguments) - required_arguments
+    if unknown_arguments:
+        raise Exception("The '{0}' arguments don't exist.".format("', '".join(sorted(unknown_arguments))))
+    auth0_user_id = input_arguments.get("auth0UserId", None)
+    if auth0_user_id is None:
+        raise Exception("The 'auth0UserId' argument can't be None/Null/Undefined.")
 
-    # Return nothing.
-    return None
+    # Return the input arguments.
+    return {
+        "auth0_user_id": auth0_user_id
+    }
 
 
-def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
+def reuse_or_recreate_postgresql_connection():
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
@@ -115,8 +139,10 @@ def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
         except Exception as error:
             logger.error(error)
             raise Exception("Unable to connect to the PostgreSQL database.")
-    queue.put({"postgresql_connection": POSTGRESQL_CONNECTION})
-    return None
+
+        # The databases layer already returns connections in autocommit mode, so this only makes it explicit.
+        POSTGRESQL_CONNECTION.autocommit = True
+    return POSTGRESQL_CONNECTION
 
 
 def postgresql_wrapper(function):
@@ -149,60 +175,19 @@ def get_internal_user_data(**kwargs) -> Any:
         logger.error(error)
         raise Exception(error)
 
-    # Prepare the SQL request that return information about new created internal user.
-    sql_statement = """
-    select
-        internal_users.auth0_user_id::text,
-        internal_users.auth0_metadata::text,
-        users.user_id::text,
-        users.user_nickname::text,
-        users.user_profile_photo_url::text,
-        internal_users.internal_user_first_name::text as user_first_name,
-        internal_users.internal_user_last_name::text as user_last_name,
-        internal_users.internal_user_middle_name::text as user_middle_name,
-        internal_users.internal_user_primary_email::text as user_primary_email,
-        internal_users.internal_user_secondary_email::text[] as user_secondary_email,
-        internal_users.internal_user_primary_phone_number::text as user_primary_phone_number,
-        internal_users.internal_user_secondary_phone_number::text[] as user_secondary_phone_number,
-        internal_users.internal_user_position_name::text as user_position_name,
-        genders.gender_id::text,
-        genders.gender_technical_name::text,
-        genders.gender_public_name::text,
-        roles.role_id::text,
-        roles.role_technical_name::text,
-        roles.role_public_name::text,
-        roles.role_description::text,
-        organizations.organization_id::text,
-        organizations.organization_name::text,
-        organizations.organization_level::smallint,
-        organizations.parent_organization_id::text,
-        organizations.parent_organization_name::text,
-        organizations.parent_organization_level::smallint,
-        organizations.root_organization_id::text,
-        organizations.root_organization_name::text,
-        organizations.root_organization_level::smallint,
-        organizations.tree_organization_id::text,
-        organizations.tree_organization_name::text
-    from
-        users
-    left join internal_users on
-        users.internal_user_id = internal_users.internal_user_id
-    left join genders on
-        internal_users.gender_id = genders.gender_id
-    left join roles on
-        internal_users.role_id = roles.role_id
-    left join organizations on
-        internal_users.organization_id = organizations.organization_id
-    where
-        internal_users.auth0_user_id = %(auth0_user_id)s
-    and
-        users.internal_user_id is not null
-    limit 1;
-    """
+    # Prepare the SQL request only once for the current connection.
+    global INTERNAL_USER_PREPARED_CONNECTION
+    if INTERNAL_USER_PREPARED_CONNECTION is not cursor.connection:
+        try:
+            cursor.execute(PREPARE_INTERNAL_USER_SQL_STATEMENT)
+        except Exception as error:
+            logger.error(error)
+            raise Exception(error)
+        INTERNAL_USER_PREPARED_CONNECTION = cursor.connection
 
-    # Execute the SQL query dynamically, in a convenient and safe way.
+    # Execute the prepared SQL query dynamically, in a convenient and safe way.
     try:
-        cursor.execute(sql_statement, sql_arguments)
+        cursor.execute("execute get_internal_user (%(auth0_user_id)s);", sql_arguments)
     except Exception as error:
         logger.error(error)
         raise Exception(error)
@@ -223,15 +208,10 @@ def analyze_and_format_internal_user_data(**kwargs) -> Any:
     internal_user = {}
     if internal_user_data is not None:
         gender, role, organization = {}, {}, {}
+        objects = {"internal_user": internal_user, "gender": gender, "role": role, "organization": organization}
         for key, value in internal_user_data.items():
-            if key.startswith("gender_"):
-                gender[utils.camel_case(key)] = value
-            elif key.startswith("role_"):
-                role[utils.camel_case(key)] = value
-            elif "organization_" in key:
-                organization[utils.camel_case(key)] = value
-            else:
-                internal_user[utils.camel_case(key)] = value
+            object_name, camel_case_key = define_object_name_and_key(key)
+            objects[object_name][camel_case_key] = value
         internal_user["gender"] = gender
         internal_user["role"] = role
         internal_user["organization"] = organization
@@ -245,34 +225,33 @@ def lambda_handler(event, context):
     :param event: The AWS Lambda function uses this parameter to pass in event data to the handler.
     :param context: The AWS Lambda function uses this parameter to provide runtime information to your handler.
     """
-    # Run several initialization functions in parallel.
-    results_of_tasks = run_multithreading_tasks([
-        {
-            "function_object": check_input_arguments,
-            "function_arguments": {
-                "event": event
-            }
-        },
-        {
-            "function_object": reuse_or_recreate_postgresql_connection,
-            "function_arguments": {}
-        }
-    ])
-
     # Define the input arguments of the AWS Lambda function.
-    input_arguments = results_of_tasks["input_arguments"]
+    input_arguments = check_input_arguments(event=event)
     auth0_user_id = input_arguments["auth0_user_id"]
 
-    # Define the instances of the database connections.
-    postgresql_connection = results_of_tasks["postgresql_connection"]
-
-    # Get information of the internal user.
-    internal_user_data = get_internal_user_data(
-        postgresql_connection=postgresql_connection,
-        sql_arguments={
-            "auth0_user_id": auth0_user_id
-        }
-    )
+    # Take information of the internal user from the cache if it is fresh enough.
+    cached_internal_user = INTERNAL_USERS_CACHE.get(auth0_user_id)
+    if cached_internal_user is not None and time.monotonic() - cached_internal_user[0] < INTERNAL_USERS_CACHE_TTL:
+        INTERNAL_USERS_CACHE.move_to_end(auth0_user_id)
+        internal_user_data = dict(cached_internal_user[1])
+    else:
+        # Define the instances of the database connections.
+        postgresql_connection = reuse_or_recreate_postgresql_connection()
+
+        # Get information of the internal user.
+        internal_user_data = get_internal_user_data(
+            postgresql_connection=postgresql_connection,
+            sql_arguments={
+                "auth0_user_id": auth0_user_id
+            }
+        )
+
+        # Put information of the internal user in the cache and remove the least recently used one if it is full.
+        if internal_user_data is not None:
+            INTERNAL_USERS_CACHE[auth0_user_id] = (time.monotonic(), tuple(internal_user_data.items()))
+            INTERNAL_USERS_CACHE.move_to_end(auth0_user_id)
+            if len(INTERNAL_USERS_CACHE) > INTERNAL_USERS_CACHE_MAX_SIZE:
+                INTERNAL_USERS_CACHE.popitem(last=False)
 
     # Define variable that stores formatted information about internal user.
     internal_user = analyze_and_format_internal_user_data(internal_user_data=internal_user_data)
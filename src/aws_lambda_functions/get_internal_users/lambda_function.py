@@ -1,11 +1,10 @@
 import logging
 import os
-import uuid
-from psycopg2.extras import RealDictCursor
+import re
+import base64
+import binascii
 from functools import wraps
 from typing import *
-from threading import Thread
-from queue import Queue
 import databases
 import utils
 
@@ -20,98 +19,143 @@ POSTGRESQL_HOST = os.environ["POSTGRESQL_HOST"]
 POSTGRESQL_PORT = int(os.environ["POSTGRESQL_PORT"])
 POSTGRESQL_DB_NAME = os.environ["POSTGRESQL_DB_NAME"]
 
+# The compiled pattern of the UUID format that is used to validate input arguments.
+UUID_PATTERN = re.compile(r"\A[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\Z")
+
 # The connection to the database will be created the first time the AWS Lambda function is called.
 # Any subsequent call to the function will use the same database connection until the container stops.
 POSTGRESQL_CONNECTION = None
 
-
-def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[AnyStr, Any]]]]) -> Dict[AnyStr, Any]:
-    # Create the empty list to save all parallel threads.
-    threads = []
-
-    # Create the queue to store all results of functions.
-    queue = Queue()
-
-    # Create the thread for each function.
-    for function in functions:
-        # Check whether the input arguments have keys in their dictionaries.
-        try:
-            function_object = function["function_object"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-        try:
-            function_arguments = function["function_arguments"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-
-        # Add the instance of the queue to the list of function arguments.
-        function_arguments["queue"] = queue
-
-        # Create the thread.
-        thread = Thread(target=function_object, kwargs=function_arguments)
-        threads.append(thread)
-
-    # Start all parallel threads.
-    for thread in threads:
-        thread.start()
-
-    # Wait until all parallel threads are finished.
-    for thread in threads:
-        thread.join()
-
-    # Get the results of all threads.
-    results = {}
-    while not queue.empty():
-        results = {**results, **queue.get()}
-
-    # Return the results of all threads.
-    return results
-
-
-def check_input_arguments(**kwargs) -> None:
+# The cursor is opened on the cached connection once and reused by all the queries of the warm container.
+POSTGRESQL_CURSOR = None
+
+# The columns of the SQL query are the same in every invocation, so the camel case names of the keys of each nested
+# object and the slice of its columns are defined the first time the AWS Lambda function is called.
+INTERNAL_USERS_SCHEMA = None
+
+# The SQL request that returns the list of internal users who have interacted with the company.
+INTERNAL_USERS_SQL_STATEMENT = """
+select
+    internal_users.auth0_user_id::text,
+    internal_users.auth0_metadata::text,
+    users.user_id::text,
+    users.user_nickname::text,
+    users.user_profile_photo_url::text,
+    internal_users.internal_user_first_name::text as user_first_name,
+    internal_users.internal_user_last_name::text as user_last_name,
+    internal_users.internal_user_middle_name::text as user_middle_name,
+    internal_users.internal_user_primary_email::text as user_primary_email,
+    internal_users.internal_user_secondary_email::text[] as user_secondary_email,
+    internal_users.internal_user_primary_phone_number::text as user_primary_phone_number,
+    internal_users.internal_user_secondary_phone_number::text[] as user_secondary_phone_number,
+    internal_users.internal_user_position_name::text as user_position_name,
+    genders.gender_id::text,
+    genders.gender_technical_name::text,
+    genders.gender_public_name::text,
+    roles.role_id::text,
+    roles.role_technical_name::text,
+    roles.role_public_name::text,
+    roles.role_description::text,
+    organizations.organization_id::text,
+    organizations.organization_name::text,
+    organizations.organization_level::smallint,
+    organizations.parent_organization_id::text,
+    organizations.parent_organization_name::text,
+    organizations.parent_organization_level::smallint,
+    organizations.root_organization_id::text,
+    organizations.root_organization_name::text,
+    organizations.root_organization_level::smallint,
+    organizations.tree_organization_id::text,
+    organizations.tree_organization_name::text
+from
+    users
+left join internal_users on
+    users.internal_user_id = internal_users.internal_user_id
+left join genders on
+    internal_users.gender_id = genders.gender_id
+left join roles on
+    internal_users.role_id = roles.role_id
+left join organizations on
+    internal_users.organization_id = organizations.organization_id
+where
+    users.internal_user_id is not null
+and
+    users.entry_deleted_date_time is null
+and
+    organizations.root_organization_id = %(root_organization_id)s
+and
+    (%(last_user_id)s::uuid is null or users.user_id > %(last_user_id)s::uuid)
+order by
+    users.user_id
+offset %(offset)s limit %(limit)s;
+"""
+
+# The SQL request that returns the total count of internal users who have interacted with the company.
+# The filter by the root organization rejects the users without the internal user, so the joins are inner.
+# It is prepared once per connection and then only executed.
+PREPARE_INTERNAL_USERS_COUNT_SQL_STATEMENT = """
+prepare get_internal_users_count (uuid) as
+select
+    count(*) as total_items_count
+from
+    users
+inner join internal_users on
+    users.internal_user_id = internal_users.internal_user_id
+inner join organizations on
+    internal_users.organization_id = organizations.organization_id
+where
+    users.entry_deleted_date_time is null
+and
+    organizations.root_organization_id = $1;
+"""
+
+# The connection on which the count of internal users is prepared.
+INTERNAL_USERS_COUNT_PREPARED_CONNECTION = None
+
+
+def check_input_arguments(**kwargs) -> Dict:
     # Make sure that all the necessary arguments for the AWS Lambda function are present.
     try:
         input_arguments = kwargs["event"]["arguments"]
     except KeyError as error:
         logger.error(error)
         raise Exception(error)
-    try:
-        queue = kwargs["queue"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
 
     # Check the format and values of required arguments in the list of input arguments.
     required_arguments = ["rootOrganizationId", "itemsCountPerPage", "currentPageNumber"]
+    optional_arguments = ["pageCursor", "totalItemsCount"]
     for argument_name, argument_value in input_arguments.items():
-        if argument_name not in required_arguments:
+        if argument_name not in required_arguments and argument_name not in optional_arguments:
             raise Exception("The '{0}' argument doesn't exist.".format(argument_name))
-        if argument_value is None:
+        if argument_value is None and argument_name not in optional_arguments:
             raise Exception("The '{0}' argument can't be None/Null/Undefined.".format(argument_name))
         if argument_name == "rootOrganizationId":
-            try:
-                uuid.UUID(argument_value)
-            except ValueError:
+            if not isinstance(argument_value, str) or not UUID_PATTERN.match(argument_value):
                 raise Exception("The '{0}' argument format is not UUID.".format(argument_name))
 
-    # Put the result of the function in the queue.
-    queue.put({
-        "input_arguments": {
-            "root_organization_id": input_arguments["rootOrganizationId"],
-            "items_count_per_page": input_arguments["itemsCountPerPage"],
-            "current_page_number": input_arguments["currentPageNumber"]
-        }
-    })
+    # The page cursor is the base64 encoded id of the last internal user of the previous page.
+    last_user_id = None
+    if input_arguments.get("pageCursor", None) is not None:
+        try:
+            last_user_id = base64.urlsafe_b64decode(input_arguments["pageCursor"]).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise Exception("The 'pageCursor' argument format is incorrect.")
+        if not UUID_PATTERN.match(last_user_id):
+            raise Exception("The 'pageCursor' argument format is incorrect.")
 
-    # Return nothing.
-    return None
+    # Return the input arguments.
+    return {
+        "root_organization_id": input_arguments["rootOrganizationId"],
+        "items_count_per_page": input_arguments["itemsCountPerPage"],
+        "current_page_number": input_arguments["currentPageNumber"],
+        "last_user_id": last_user_id,
+        "total_items_count": input_arguments.get("totalItemsCount", None)
+    }
 
 
-def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
+def reuse_or_recreate_postgresql_connection():
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
@@ -123,28 +167,47 @@ def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
         except Exception as error:
             logger.error(error)
             raise Exception("Unable to connect to the PostgreSQL database.")
-    queue.put({"postgresql_connection": POSTGRESQL_CONNECTION})
-    return None
+
+        # The databases layer already returns connections in autocommit mode, so this only makes it explicit.
+        POSTGRESQL_CONNECTION.autocommit = True
+    return POSTGRESQL_CONNECTION
+
+
+def define_object_name_and_key(key: AnyStr) -> Tuple[AnyStr, AnyStr]:
+    if key.startswith("gender_"):
+        return "gender", utils.camel_case(key)
+    if key.startswith("role_"):
+        return "role", utils.camel_case(key)
+    if "organization_" in key:
+        return "organization", utils.camel_case(key)
+    return "internal_user", utils.camel_case(key)
 
 
 def postgresql_wrapper(function):
     @wraps(function)
     def wrapper(**kwargs):
+        global POSTGRESQL_CONNECTION, POSTGRESQL_CURSOR
         try:
             postgresql_connection = kwargs["postgresql_connection"]
         except KeyError as error:
             logger.error(error)
             raise Exception(error)
-        cursor = postgresql_connection.cursor(cursor_factory=RealDictCursor)
-        kwargs["cursor"] = cursor
-        result = function(**kwargs)
-        cursor.close()
+        if POSTGRESQL_CURSOR is None or POSTGRESQL_CURSOR.connection is not postgresql_connection:
+            POSTGRESQL_CURSOR = postgresql_connection.cursor()
+        kwargs["cursor"] = POSTGRESQL_CURSOR
+        try:
+            result = function(**kwargs)
+        except Exception:
+            # Forget the broken connection so that the next call of the warm container creates a new one.
+            if postgresql_connection.closed:
+                POSTGRESQL_CONNECTION, POSTGRESQL_CURSOR = None, None
+            raise
         return result
     return wrapper
 
 
 @postgresql_wrapper
-def get_internal_users_data(**kwargs) -> List[Dict[AnyStr, Any]]:
+def get_internal_users_data(**kwargs) -> List[Tuple]:
     # Check if the input dictionary has all the necessary keys.
     try:
         cursor = kwargs["cursor"]
@@ -157,71 +220,68 @@ def get_internal_users_data(**kwargs) -> List[Dict[AnyStr, Any]]:
         logger.error(error)
         raise Exception(error)
 
-    # Prepare the SQL request that returns the list of internal users who have interacted with the company.
-    sql_statement = """
-    select
-        count(*) over() as total_items_count,
-        internal_users.auth0_user_id::text,
-        internal_users.auth0_metadata::text,
-        users.user_id::text,
-        users.user_nickname::text,
-        users.user_profile_photo_url::text,
-        internal_users.internal_user_first_name::text as user_first_name,
-        internal_users.internal_user_last_name::text as user_last_name,
-        internal_users.internal_user_middle_name::text as user_middle_name,
-        internal_users.internal_user_primary_email::text as user_primary_email,
-        internal_users.internal_user_secondary_email::text[] as user_secondary_email,
-        internal_users.internal_user_primary_phone_number::text as user_primary_phone_number,
-        internal_users.internal_user_secondary_phone_number::text[] as user_secondary_phone_number,
-        internal_users.internal_user_position_name::text as user_position_name,
-        genders.gender_id::text,
-        genders.gender_technical_name::text,
-        genders.gender_public_name::text,
-        roles.role_id::text,
-        roles.role_technical_name::text,
-        roles.role_public_name::text,
-        roles.role_description::text,
-        organizations.organization_id::text,
-        organizations.organization_name::text,
-        organizations.organization_level::smallint,
-        organizations.parent_organization_id::text,
-        organizations.parent_organization_name::text,
-        organizations.parent_organization_level::smallint,
-        organizations.root_organization_id::text,
-        organizations.root_organization_name::text,
-        organizations.root_organization_level::smallint,
-        organizations.tree_organization_id::text,
-        organizations.tree_organization_name::text
-    from
-        users
-    left join internal_users on
-        users.internal_user_id = internal_users.internal_user_id
-    left join genders on
-        internal_users.gender_id = genders.gender_id
-    left join roles on
-        internal_users.role_id = roles.role_id
-    left join organizations on
-        internal_users.organization_id = organizations.organization_id
-    where
-        users.internal_user_id is not null
-    and
-        users.entry_deleted_date_time is null
-    and
-        organizations.root_organization_id = %(root_organization_id)s
-    offset %(offset)s limit %(limit)s;
-    """
-
     # Execute the SQL query dynamically, in a convenient and safe way.
     try:
-        cursor.execute(sql_statement, sql_arguments)
+        cursor.execute(INTERNAL_USERS_SQL_STATEMENT, sql_arguments)
     except Exception as error:
         logger.error(error)
         raise Exception(error)
 
+    # Define the keys of each nested object and the slice of its columns. The SQL request lists them one after another.
+    global INTERNAL_USERS_SCHEMA
+    if INTERNAL_USERS_SCHEMA is None:
+        schema = {}
+        for position, column in enumerate(cursor.description):
+            object_name, key = define_object_name_and_key(column.name)
+            keys, positions = schema.setdefault(object_name, ([], []))
+            if positions and positions[-1] != position - 1:
+                raise Exception("The columns of the '{0}' object must be consecutive.".format(object_name))
+            keys.append(key)
+            positions.append(position)
+        INTERNAL_USERS_SCHEMA = {
+            object_name: (tuple(keys), slice(positions[0], positions[-1] + 1))
+            for object_name, (keys, positions) in schema.items()
+        }
+
     # Return the list of internal users who have interacted with the company.
     return cursor.fetchall()
 
 
+@postgresql_wrapper
+def get_internal_users_count(**kwargs) -> int:
+    # Check if the input dictionary has all the necessary keys.
+    try:
+        cursor = kwargs["cursor"]
+    except KeyError as error:
+        logger.error(error)
+        raise Exception(error)
+    try:
+        sql_arguments = kwargs["sql_arguments"]
+    except KeyError as error:
+        logger.error(error)
+        raise Exception(error)
+
+    # Prepare the SQL request only once for the current connection.
+    global INTERNAL_USERS_COUNT_PREPARED_CONNECTION
+    if INTERNAL_USERS_COUNT_PREPARED_CONNECTION is not cursor.connection:
+        try:
+            cursor.execute(PREPARE_INTERNAL_USERS_COUNT_SQL_STATEMENT)
+        except Exception as error:
+            logger.error(error)
+            raise Exception(error)
+        INTERNAL_USERS_COUNT_PREPARED_CONNECTION = cursor.connection
+
+    # Execute the prepared SQL query dynamically, in a convenient and safe way.
+    try:
+        cursor.execute("execute get_internal_users_count (%(root_organization_id)s);", sql_arguments)
+    except Exception as error:
+        logger.error(error)
+        raise Exception(error)
+
+    # Return the total count of internal users.
+    return cursor.fetchone()[0]
+
+
 def analyze_and_format_internal_users_data(**kwargs) -> Any:
     # Check if the input dictionary has all the necessary keys.
     try:
@@ -230,32 +290,22 @@ def analyze_and_format_internal_users_data(**kwargs) -> Any:
         logger.error(error)
         raise Exception(error)
 
-    # Format the internal users data.
+    # Format the internal users data. Each object is built at once from its keys and the slice of its columns.
     internal_users = []
-    total_items_count = 0
-    if internal_users_data is not None:
-        for index, record in enumerate(internal_users_data):
-            internal_user, gender, role, organization = {}, {}, {}, {}
-            for key, value in record.items():
-                if key == "total_number_of_users":
-                    break
-                elif key.startswith("gender_"):
-                    gender[utils.camel_case(key)] = value
-                elif key.startswith("role_"):
-                    role[utils.camel_case(key)] = value
-                elif "organization_" in key:
-                    organization[utils.camel_case(key)] = value
-                else:
-                    internal_user[utils.camel_case(key)] = value
-            internal_user["gender"] = gender
-            internal_user["role"] = role
-            internal_user["organization"] = organization
+    if internal_users_data:
+        internal_user_keys, internal_user_columns = INTERNAL_USERS_SCHEMA["internal_user"]
+        gender_keys, gender_columns = INTERNAL_USERS_SCHEMA["gender"]
+        role_keys, role_columns = INTERNAL_USERS_SCHEMA["role"]
+        organization_keys, organization_columns = INTERNAL_USERS_SCHEMA["organization"]
+        for record in internal_users_data:
+            internal_user = dict(zip(internal_user_keys, record[internal_user_columns]))
+            internal_user["gender"] = dict(zip(gender_keys, record[gender_columns]))
+            internal_user["role"] = dict(zip(role_keys, record[role_columns]))
+            internal_user["organization"] = dict(zip(organization_keys, record[organization_columns]))
             internal_users.append(internal_user)
-            if index == 0:
-                total_items_count = record["total_items_count"]
 
-    # Return the internal users and the total count of items.
-    return internal_users, total_items_count
+    # Return the internal users.
+    return internal_users
 
 
 def lambda_handler(event, context):
@@ -263,28 +313,16 @@ def lambda_handler(event, context):
     :param event: The AWS Lambda function uses this parameter to pass in event data to the handler.
     :param context: The AWS Lambda function uses this parameter to provide runtime information to your handler.
     """
-    # Run several initialization functions in parallel.
-    results_of_tasks = run_multithreading_tasks([
-        {
-            "function_object": check_input_arguments,
-            "function_arguments": {
-                "event": event
-            }
-        },
-        {
-            "function_object": reuse_or_recreate_postgresql_connection,
-            "function_arguments": {}
-        }
-    ])
-
     # Define the input arguments of the AWS Lambda function.
-    input_arguments = results_of_tasks["input_arguments"]
+    input_arguments = check_input_arguments(event=event)
     root_organization_id = input_arguments["root_organization_id"]
     items_count_per_page = input_arguments["items_count_per_page"]
     current_page_number = input_arguments["current_page_number"]
+    last_user_id = input_arguments["last_user_id"]
+    total_items_count = input_arguments["total_items_count"]
 
     # Define the instances of the database connections.
-    postgresql_connection = results_of_tasks["postgresql_connection"]
+    postgresql_connection = reuse_or_recreate_postgresql_connection()
 
     # Get a list of internal users who have interacted with the company.
     internal_users_data = get_internal_users_data(
@@ -292,12 +330,27 @@ def lambda_handler(event, context):
         sql_arguments={
             "root_organization_id": root_organization_id,
             "limit": items_count_per_page,
-            "offset": (current_page_number - 1) * items_count_per_page
+            "offset": 0 if last_user_id else (current_page_number - 1) * items_count_per_page,
+            "last_user_id": last_user_id
         }
     )
 
-    # Define variables that stores formatted information.
-    internal_users, total_items_count = analyze_and_format_internal_users_data(internal_users_data=internal_users_data)
+    # Count the internal users on the first page only, the next pages reuse the count sent back by the client.
+    if current_page_number == 1 or total_items_count is None:
+        total_items_count = get_internal_users_count(
+            postgresql_connection=postgresql_connection,
+            sql_arguments={
+                "root_organization_id": root_organization_id
+            }
+        )
+
+    # Define variable that stores formatted information.
+    internal_users = analyze_and_format_internal_users_data(internal_users_data=internal_users_data)
+
+    # The cursor of the next page is defined only when the current page is full.
+    next_page_cursor = None
+    if len(internal_users) == items_count_per_page:
+        next_page_cursor = base64.urlsafe_b64encode(internal_users[-1]["userId"].encode("utf-8")).decode("utf-8")
 
     # Return the full information about the internal users as the response.
     return {
@@ -305,6 +358,7 @@ def lambda_handler(event, context):
         "pageInformation": {
             "currentPageNumber": current_page_number,
             "itemsCountPerPage": items_count_per_page,
-            "totalItemsCount": total_items_count
+            "totalItemsCount": total_items_count,
+            "nextPageCursor": next_page_cursor
         }
     }
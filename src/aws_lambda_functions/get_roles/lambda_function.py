@@ -1,10 +1,9 @@
 import logging
 import os
-from psycopg2.extras import RealDictCursor
+import time
 from functools import wraps
 from typing import *
 import databases
-import utils
 
 # Configure the logging tool in the AWS Lambda function.
 logger = logging.getLogger(__name__)
@@ -21,10 +20,26 @@ POSTGRESQL_DB_NAME = os.environ["POSTGRESQL_DB_NAME"]
 # Any subsequent call to the function will use the same database connection until the container stops.
 POSTGRESQL_CONNECTION = None
 
+# The cursor is opened on the cached connection once and reused by all the queries of the warm container.
+POSTGRESQL_CURSOR = None
+
+# The names of the role's fields in the order of the columns returned by the roles query.
+ROLES_COLUMNS = (
+    "roleId",
+    "roleTechnicalName",
+    "rolePublicName",
+    "roleDescription"
+)
+
+# The roles are a reference table that changes rarely, so keep the formatted list of roles in the container.
+# The cache stores the time when the roles were loaded and the list of roles.
+ROLES_CACHE = None
+ROLES_CACHE_TTL = 300
+
 
 def reuse_or_recreate_postgresql_connection():
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
@@ -36,27 +51,37 @@ def reuse_or_recreate_postgresql_connection():
         except Exception as error:
             logger.error(error)
             raise Exception("Unable to connect to the PostgreSQL database.")
+
+        # The databases layer already returns connections in autocommit mode, so this only makes it explicit.
+        POSTGRESQL_CONNECTION.autocommit = True
     return POSTGRESQL_CONNECTION
 
 
 def postgresql_wrapper(function):
     @wraps(function)
     def wrapper(**kwargs):
+        global POSTGRESQL_CONNECTION, POSTGRESQL_CURSOR
         try:
             postgresql_connection = kwargs["postgresql_connection"]
         except KeyError as error:
             logger.error(error)
             raise Exception(error)
-        cursor = postgresql_connection.cursor(cursor_factory=RealDictCursor)
-        kwargs["cursor"] = cursor
-        result = function(**kwargs)
-        cursor.close()
+        if POSTGRESQL_CURSOR is None or POSTGRESQL_CURSOR.connection is not postgresql_connection:
+            POSTGRESQL_CURSOR = postgresql_connection.cursor()
+        kwargs["cursor"] = POSTGRESQL_CURSOR
+        try:
+            result = function(**kwargs)
+        except Exception:
+            # Forget the broken connection so that the next call of the warm container creates a new one.
+            if postgresql_connection.closed:
+                POSTGRESQL_CONNECTION, POSTGRESQL_CURSOR = None, None
+            raise
         return result
     return wrapper
 
 
 @postgresql_wrapper
-def get_roles_data(**kwargs) -> List[Dict[AnyStr, Any]]:
+def get_roles_data(**kwargs) -> List[Tuple[Any, ...]]:
     # Check if the input dictionary has all the necessary keys.
     try:
         cursor = kwargs["cursor"]
@@ -95,19 +120,18 @@ def analyze_and_format_roles_data(**kwargs) -> Any:
         raise Exception(error)
 
     # Format the roles data.
-    roles = []
-    if roles_data is not None:
-        for record in roles_data:
-            role = {}
-            for key, value in record.items():
-                role[utils.camel_case(key)] = value
-            roles.append(role)
+    roles = [dict(zip(ROLES_COLUMNS, record)) for record in roles_data]
 
     # Return the roles.
     return roles
 
 
 def lambda_handler(event, context):
+    # Return the list of roles from the cache if it is fresh enough.
+    global ROLES_CACHE
+    if ROLES_CACHE is not None and time.monotonic() - ROLES_CACHE[0] < ROLES_CACHE_TTL:
+        return ROLES_CACHE[1]
+
     # Define the instances of the database connections.
     postgresql_connection = reuse_or_recreate_postgresql_connection()
 
@@ -117,5 +141,8 @@ def lambda_handler(event, context):
     # Define variable that stores formatted information.
     roles = analyze_and_format_roles_data(roles_data=roles_data)
 
+    # Put the list of roles in the cache.
+    ROLES_CACHE = (time.monotonic(), roles)
+
     # Return the list of roles as the response.
     return roles
@@ -2,13 +2,9 @@ import logging
 import os
 import json
 import uuid
-from psycopg2.extras import RealDictCursor
 from functools import wraps
 from typing import *
-from threading import Thread
-from queue import Queue
 import databases
-import utils
 
 # Configure the logging tool in the AWS Lambda function.
 logger = logging.getLogger(__name__)
@@ -25,110 +21,220 @@ POSTGRESQL_DB_NAME = os.environ["POSTGRESQL_DB_NAME"]
 # Any subsequent call to the function will use the same database connection until the container stops.
 POSTGRESQL_CONNECTION = None
 
-
-def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[AnyStr, Any]]]]) -> Dict[AnyStr, Any]:
-    # Create the empty list to save all parallel threads.
-    threads = []
-
-    # Create the queue to store all results of functions.
-    queue = Queue()
-
-    # Create the thread for each function.
-    for function in functions:
-        # Check whether the input arguments have keys in their dictionaries.
-        try:
-            function_object = function["function_object"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-        try:
-            function_arguments = function["function_arguments"]
-        except KeyError as error:
-            logger.error(error)
-            raise Exception(error)
-
-        # Add the instance of the queue to the list of function arguments.
-        function_arguments["queue"] = queue
-
-        # Create the thread.
-        thread = Thread(target=function_object, kwargs=function_arguments)
-        threads.append(thread)
-
-    # Start all parallel threads.
-    for thread in threads:
-        thread.start()
-
-    # Wait until all parallel threads are finished.
-    for thread in threads:
-        thread.join()
-
-    # Get the results of all threads.
-    results = {}
-    while not queue.empty():
-        results = {**results, **queue.get()}
-
-    # Return the results of all threads.
-    return results
-
-
-def check_input_arguments(**kwargs) -> None:
+# The names of the client's fields in the order of the columns returned by the requalification.
+# The columns of the gender follow them and are put in the nested gender object.
+CLIENT_COLUMNS = (
+    "userId",
+    "userNickname",
+    "userProfilePhotoUrl",
+    "userType",
+    "createdDateTime",
+    "userFirstName",
+    "userLastName",
+    "userMiddleName",
+    "userPrimaryEmail",
+    "userSecondaryEmail",
+    "userPrimaryPhoneNumber",
+    "userSecondaryPhoneNumber",
+    "metadata",
+    "telegramUsername",
+    "whatsappProfile",
+    "whatsappUsername",
+    "instagramPrivateUsername",
+    "vkUserId",
+    "instagramProfile"
+)
+GENDER_COLUMNS = (
+    "genderId",
+    "genderTechnicalName",
+    "genderPublicName"
+)
+
+# The SQL request that creates the identified user, links it to the user instead of the unidentified user,
+# puts a tag for deletion for the unidentified user and returns information about the client in one statement.
+# The identified user is created only from the locked row of the user who is still unidentified, so the statement
+# changes nothing and returns no rows for the unknown or already identified user.
+# The final select reads the new values from the "returning" clauses, because it doesn't see the changes of the
+# statement in the tables. It is prepared once per connection and then only executed.
+# The types of the parameters are inferred from the columns they are compared with or inserted into.
+PREPARE_REQUALIFY_CLIENT_SQL_STATEMENT = """
+prepare requalify_client as
+with unidentified_user as (
+    select
+        user_id,
+        unidentified_user_id
+    from
+        users
+    where
+        user_id = $16
+    and
+        unidentified_user_id is not null
+    for update
+), identified_user as (
+    insert into identified_users (
+        identified_user_first_name,
+        identified_user_last_name,
+        identified_user_middle_name,
+        identified_user_primary_email,
+        identified_user_secondary_email,
+        identified_user_primary_phone_number,
+        identified_user_secondary_phone_number,
+        gender_id,
+        metadata,
+        telegram_username,
+        whatsapp_profile,
+        whatsapp_username,
+        instagram_private_username,
+        vk_user_id,
+        instagram_profile
+    ) select
+        $1,
+        $2,
+        $3,
+        $4,
+        $5,
+        $6,
+        $7,
+        $8,
+        $9,
+        $10,
+        $11,
+        $12,
+        $13,
+        $14,
+        $15
+    from
+        unidentified_user
+    returning
+        *
+), requalified_user as (
+    update
+        users
+    set
+        identified_user_id = identified_user.identified_user_id,
+        unidentified_user_id = null
+    from
+        identified_user,
+        unidentified_user
+    where
+        users.user_id = unidentified_user.user_id
+    returning
+        users.user_id,
+        users.user_nickname,
+        users.user_profile_photo_url,
+        users.entry_created_date_time,
+        unidentified_user.unidentified_user_id
+), deleted_unidentified_user as (
+    update
+        unidentified_users
+    set
+        entry_deleted_date_time = now()
+    from
+        requalified_user
+    where
+        unidentified_users.unidentified_user_id = requalified_user.unidentified_user_id
+)
+select
+    requalified_user.user_id::text,
+    requalified_user.user_nickname::text,
+    requalified_user.user_profile_photo_url::text,
+    'identified_user'::text as user_type,
+    requalified_user.entry_created_date_time::text as created_date_time,
+    identified_user.identified_user_first_name::text as user_first_name,
+    identified_user.identified_user_last_name::text as user_last_name,
+    identified_user.identified_user_middle_name::text as user_middle_name,
+    identified_user.identified_user_primary_email::text as user_primary_email,
+    identified_user.identified_user_secondary_email::text[] as user_secondary_email,
+    identified_user.identified_user_primary_phone_number::text as user_primary_phone_number,
+    identified_user.identified_user_secondary_phone_number::text[] as user_secondary_phone_number,
+    identified_user.metadata::text,
+    identified_user.telegram_username::text,
+    identified_user.whatsapp_profile::text,
+    identified_user.whatsapp_username::text,
+    identified_user.instagram_private_username::text,
+    identified_user.vk_user_id::text,
+    identified_user.instagram_profile::text,
+    genders.gender_id::text,
+    genders.gender_technical_name::text,
+    genders.gender_public_name::text
+from
+    requalified_user
+cross join identified_user
+left join genders on
+    identified_user.gender_id = genders.gender_id;
+"""
+
+# The SQL request that executes the prepared requalification with the arguments in the order of its parameters.
+REQUALIFY_CLIENT_EXECUTE_SQL_STATEMENT = """
+execute requalify_client (
+    %(identified_user_first_name)s,
+    %(identified_user_last_name)s,
+    %(identified_user_middle_name)s,
+    %(identified_user_primary_email)s,
+    %(identified_user_secondary_email)s,
+    %(identified_user_primary_phone_number)s,
+    %(identified_user_secondary_phone_number)s,
+    %(gender_id)s,
+    %(metadata)s,
+    %(telegram_username)s,
+    %(whatsapp_profile)s,
+    %(whatsapp_username)s,
+    %(instagram_private_username)s,
+    %(vk_user_id)s,
+    %(instagram_profile)s,
+    %(user_id)s
+);
+"""
+
+# The connection on which the requalification of the client is prepared.
+REQUALIFY_CLIENT_PREPARED_CONNECTION = None
+
+
+def check_input_arguments(**kwargs) -> Dict:
     # Make sure that all the necessary arguments for the AWS Lambda function are present.
     try:
         input_arguments = kwargs["event"]["arguments"]["input"]
     except KeyError as error:
         logger.error(error)
         raise Exception(error)
-    try:
-        queue = kwargs["queue"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
 
     # Check the format and values of required arguments in the list of input arguments.
-    required_arguments = ["userId", "metadata"]
-    for argument_name, argument_value in input_arguments.items():
-        if argument_name == "userId" and argument_name not in required_arguments:
-            raise Exception("The '{0}' argument doesn't exist.".format(argument_name))
-        if argument_name == "userId":
-            try:
-                uuid.UUID(argument_value)
-            except ValueError:
-                raise Exception("The '{0}' argument format is not UUID.".format(argument_name))
-        if argument_name == "metadata" and argument_name not in required_arguments:
-            raise Exception("The '{0}' argument doesn't exist.".format(argument_name))
-        if argument_name == "metadata" and argument_value is None:
-            raise Exception("The '{0}' argument can't be None/Null/Undefined.".format(argument_name))
-
-    # Put the result of the function in the queue.
-    queue.put({
-        "input_arguments": {
-            "user_id": input_arguments["userId"],
-            "user_profile_photo_url": input_arguments.get("userProfilePhotoUrl", None),
-            "identified_user_first_name": input_arguments.get("userFirstName", None),
-            "identified_user_last_name": input_arguments.get("userLastName", None),
-            "identified_user_middle_name": input_arguments.get("userMiddleName", None),
-            "identified_user_primary_email": input_arguments.get("userPrimaryEmail", None),
-            "identified_user_secondary_email": input_arguments.get("userSecondaryEmail", None),
-            "identified_user_primary_phone_number": input_arguments.get("userPrimaryPhoneNumber", None),
-            "identified_user_secondary_phone_number": input_arguments.get("userSecondaryPhoneNumber", None),
-            "gender_id": input_arguments.get("genderId", None),
-            "metadata": json.dumps(input_arguments["metadata"]),
-            "telegram_username": input_arguments.get("telegramUsername", None),
-            "whatsapp_profile": input_arguments.get("whatsappProfile", None),
-            "whatsapp_username": input_arguments.get("whatsappUsername", None),
-            "instagram_private_username": input_arguments.get("instagramPrivateUsername", None),
-            "vk_user_id": input_arguments.get("vkUserId", None),
-            "instagram_profile": input_arguments.get("instagramProfile", None),
-        }
-    })
-
-    # Return nothing.
-    return None
-
-
-def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
+    user_id = input_arguments.get("userId", None)
+    if user_id is None:
+        raise Exception("The 'userId' argument doesn't exist.")
+    try:
+        uuid.UUID(user_id)
+    except (TypeError, ValueError, AttributeError):
+        raise Exception("The 'userId' argument format is not UUID.")
+    metadata = input_arguments.get("metadata", None)
+    if metadata is None:
+        raise Exception("The 'metadata' argument can't be None/Null/Undefined.")
+
+    # Return the input arguments.
+    return {
+        "user_id": user_id,
+        "user_profile_photo_url": input_arguments.get("userProfilePhotoUrl", None),
+        "identified_user_first_name": input_arguments.get("userFirstName", None),
+        "identified_user_last_name": input_arguments.get("userLastName", None),
+        "identified_user_middle_name": input_arguments.get("userMiddleName", None),
+        "identified_user_primary_email": input_arguments.get("userPrimaryEmail", None),
+        "identified_user_secondary_email": input_arguments.get("userSecondaryEmail", None),
+        "identified_user_primary_phone_number": input_arguments.get("userPrimaryPhoneNumber", None),
+        "identified_user_secondary_phone_number": input_arguments.get("userSecondaryPhoneNumber", None),
+        "gender_id": input_arguments.get("genderId", None),
+        "metadata": json.dumps(metadata, separators=(",", ":")),
+        "telegram_username": input_arguments.get("telegramUsername", None),
+        "whatsapp_profile": input_arguments.get("whatsappProfile", None),
+        "whatsapp_username": input_arguments.get("whatsappUsername", None),
+        "instagram_private_username": input_arguments.get("instagramPrivateUsername", None),
+        "vk_user_id": input_arguments.get("vkUserId", None),
+        "instagram_profile": input_arguments.get("instagramProfile", None)
+    }
+
+
+def reuse_or_recreate_postgresql_connection():
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
@@ -140,28 +246,36 @@ def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
         except Exception as error:
             logger.error(error)
             raise Exception("Unable to connect to the PostgreSQL database.")
-    queue.put({"postgresql_connection": POSTGRESQL_CONNECTION})
-    return None
+    return POSTGRESQL_CONNECTION
 
 
 def postgresql_wrapper(function):
     @wraps(function)
     def wrapper(**kwargs):
+        global POSTGRESQL_CONNECTION
         try:
             postgresql_connection = kwargs["postgresql_connection"]
         except KeyError as error:
             logger.error(error)
             raise Exception(error)
-        cursor = postgresql_connection.cursor(cursor_factory=RealDictCursor)
+        cursor = postgresql_connection.cursor()
         kwargs["cursor"] = cursor
-        result = function(**kwargs)
-        cursor.close()
+        try:
+            result = function(**kwargs)
+        except Exception:
+            # Forget the broken connection so that the next call of the warm container creates a new one.
+            if postgresql_connection.closed:
+                POSTGRESQL_CONNECTION = None
+            raise
+        finally:
+            if not postgresql_connection.closed:
+                cursor.close()
         return result
     return wrapper
 
 
 @postgresql_wrapper
-def requalify_client(**kwargs) -> None:
+def requalify_client(**kwargs) -> Any:
     # Check if the input dictionary has all the necessary keys.
     try:
         cursor = kwargs["cursor"]
@@ -174,242 +288,32 @@ def requalify_client(**kwargs) -> None:
         logger.error(error)
         raise Exception(error)
 
-    # Prepare the SQL request that creates the new created identified user.
-    sql_statement = """
-    insert into identified_users (
-        identified_user_first_name,
-        identified_user_last_name,
-        identified_user_middle_name,
-        identified_user_primary_email,
-        identified_user_secondary_email,
-        identified_user_primary_phone_number,
-        identified_user_secondary_phone_number,
-        gender_id,
-        metadata,
-        telegram_username,
-        whatsapp_profile,
-        whatsapp_username,
-        instagram_private_username,
-        vk_user_id,
-        instagram_profile
-    ) values (
-        %(identified_user_first_name)s,
-        %(identified_user_last_name)s,
-        %(identified_user_middle_name)s,
-        %(identified_user_primary_email)s,
-        %(identified_user_secondary_email)s,
-        %(identified_user_primary_phone_number)s,
-        %(identified_user_secondary_phone_number)s,
-        %(gender_id)s,
-        %(metadata)s,
-        %(telegram_username)s,
-        %(whatsapp_profile)s,
-        %(whatsapp_username)s,
-        %(instagram_private_username)s,
-        %(vk_user_id)s,
-        %(instagram_profile)s
-    ) returning
-        identified_user_id::text;
-    """
-
-    # Execute the SQL query dynamically, in a convenient and safe way.
-    try:
-        cursor.execute(sql_statement, sql_arguments)
-    except Exception as error:
-        logger.error(error)
-        raise Exception(error)
-
-    # Define the id of the new created identified user.
-    try:
-        identified_user_id = cursor.fetchone()["identified_user_id"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
-
-    # Add the id of the new created identified user to the map of the sql arguments.
-    sql_arguments["identified_user_id"] = identified_user_id
-
-    # Update the user's type.
-    sql_statement = """
-    update
-        users x
-    set
-        identified_user_id = %(identified_user_id)s,
-        unidentified_user_id = null
-    from (
-        select
-            *
-        from
-            users
-        where
-            user_id = %(user_id)s
-        for update
-    ) y
-    where
-        x.user_id = y.user_id
-    returning
-        y.unidentified_user_id::text;
-    """
-
-    # Execute the SQL query dynamically, in a convenient and safe way.
-    try:
-        cursor.execute(sql_statement, sql_arguments)
-    except Exception as error:
-        logger.error(error)
-        raise Exception(error)
-
-    # Define the id of the unidentified user.
-    try:
-        unidentified_user_id = cursor.fetchone()["unidentified_user_id"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
-
-    # Add the id of the unidentified user_id to the map of the sql arguments.
-    sql_arguments["unidentified_user_id"] = unidentified_user_id
-
-    # Put a tag for deletion for the unidentified user.
-    sql_statement = """
-    update
-        unidentified_users
-    set
-        entry_deleted_date_time = now()
-    where
-        unidentified_user_id = %(unidentified_user_id)s;
-    """
+    # Prepare the SQL request only once for the current connection.
+    global REQUALIFY_CLIENT_PREPARED_CONNECTION
+    if REQUALIFY_CLIENT_PREPARED_CONNECTION is not cursor.connection:
+        try:
+            cursor.execute(PREPARE_REQUALIFY_CLIENT_SQL_STATEMENT)
+        except Exception as error:
+            logger.error(error)
+            raise Exception(error)
+        REQUALIFY_CLIENT_PREPARED_CONNECTION = cursor.connection
 
-    # Execute the SQL query dynamically, in a convenient and safe way.
+    # Execute the prepared SQL query dynamically, in a convenient and safe way.
     try:
-        cursor.execute(sql_statement, sql_arguments)
+        cursor.execute(REQUALIFY_CLIENT_EXECUTE_SQL_STATEMENT, sql_arguments)
     except Exception as error:
         logger.error(error)
         raise Exception(error)
 
-    # Return nothing.
-    return None
+    # The statement returns no rows when the user doesn't exist or isn't unidentified.
+    client_data = cursor.fetchone()
+    if client_data is None:
+        raise Exception("The unidentified client with the '{0}' user ID doesn't exist.".format(
+            sql_arguments["user_id"]
+        ))
 
-
-@postgresql_wrapper
-def get_client_data(**kwargs) -> Any:
-    # Check if the input dictionary has all the necessary keys.
-    try:
-        cursor = kwargs["cursor"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
-    try:
-        sql_arguments = kwargs["sql_arguments"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
-
-    # Prepare the SQL request that return information about the client.
-    sql_statement = """
-    select
-        users.user_id::text,
-        users.user_nickname::text,
-        users.user_profile_photo_url::text,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then 'identified_user'::text
-            else 'unidentified_user'::text
-        end as user_type,
-        users.entry_created_date_time::text as created_date_time,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then identified_users.identified_user_first_name::text
-            else null
-        end as user_first_name,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then identified_users.identified_user_last_name::text
-            else null
-        end as user_last_name,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then identified_users.identified_user_middle_name::text
-            else null
-        end as user_middle_name,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then identified_users.identified_user_primary_email::text
-            else null
-        end as user_primary_email,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then identified_users.identified_user_secondary_email::text[]
-            else null
-        end as user_secondary_email,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then identified_users.identified_user_primary_phone_number::text
-            else null
-        end as user_primary_phone_number,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then identified_users.identified_user_secondary_phone_number::text[]
-            else null
-        end as user_secondary_phone_number,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then identified_users.metadata::text
-            else unidentified_users.metadata::text
-        end as metadata,
-        case
-            when users.identified_user_id is not null
-            and users.unidentified_user_id is null then identified_users.telegram_username::text
-            else null
-        end as telegram_username,
-        case
-            when users.identified_user_id is not null
-            and users.unidentified_user_id is null then identified_users.whatsapp_profile::text
-            else null
-        end as whatsapp_profile,
-        case
-            when users.identified_user_id is not null
-            and users.unidentified_user_id is null then identified_users.whatsapp_username::text
-            else null
-        end as whatsapp_username,
-        case
-            when users.identified_user_id is not null
-            and users.unidentified_user_id is null then identified_users.instagram_private_username::text
-            else null
-        end as instagram_private_username,
-        case
-            when users.identified_user_id is not null
-            and users.unidentified_user_id is null then identified_users.vk_user_id::text
-            else null
-        end as vk_user_id,
-        case
-            when users.identified_user_id is not null and users.unidentified_user_id is null
-            then identified_users.instagram_profile::text
-            else null
-        end as instagram_profile,
-        genders.gender_id::text,
-        genders.gender_technical_name::text,
-        genders.gender_public_name::text
-    from
-        users
-    left join identified_users on
-        users.identified_user_id = identified_users.identified_user_id
-    left join unidentified_users on
-        users.unidentified_user_id = unidentified_users.unidentified_user_id
-    left join genders on
-        identified_users.gender_id = genders.gender_id
-    where
-        users.user_id = %(user_id)s
-    limit 1;
-    """
-
-    # Execute the SQL query dynamically, in a convenient and safe way.
-    try:
-        cursor.execute(sql_statement, sql_arguments)
-    except Exception as error:
-        logger.error(error)
-        raise Exception(error)
-
-    # Return the information of the client.
-    return cursor.fetchone()
+    # Return the information of the requalified client.
+    return client_data
 
 
 def analyze_and_format_client_data(**kwargs) -> Any:
@@ -421,15 +325,8 @@ def analyze_and_format_client_data(**kwargs) -> Any:
         raise Exception(error)
 
     # Format the client data.
-    client = {}
-    if client_data is not None:
-        gender = {}
-        for key, value in client_data.items():
-            if key.startswith("gender_"):
-                gender[utils.camel_case(key)] = value
-            else:
-                client[utils.camel_case(key)] = value
-        client["gender"] = gender
+    client = dict(zip(CLIENT_COLUMNS, client_data))
+    client["gender"] = dict(zip(GENDER_COLUMNS, client_data[len(CLIENT_COLUMNS):]))
 
     # Return the information of the client.
     return client
@@ -440,36 +337,14 @@ def lambda_handler(event, context):
     :param event: The AWS Lambda function uses this parameter to pass in event data to the handler.
     :param context: The AWS Lambda function uses this parameter to provide runtime information to your handler.
     """
-    # Run several initialization functions in parallel.
-    results_of_tasks = run_multithreading_tasks([
-        {
-            "function_object": check_input_arguments,
-            "function_arguments": {
-                "event": event
-            }
-        },
-        {
-            "function_object": reuse_or_recreate_postgresql_connection,
-            "function_arguments": {}
-        }
-    ])
-
     # Define the input arguments of the AWS Lambda function.
-    input_arguments = results_of_tasks["input_arguments"]
+    input_arguments = check_input_arguments(event=event)
 
     # Define the instances of the database connections.
-    postgresql_connection = results_of_tasks["postgresql_connection"]
-
-    # Requalify the client.
-    requalify_client(postgresql_connection=postgresql_connection, sql_arguments=input_arguments)
+    postgresql_connection = reuse_or_recreate_postgresql_connection()
 
-    # Get information of the client.
-    client_data = get_client_data(
-        postgresql_connection=postgresql_connection,
-        sql_arguments={
-            "user_id": input_arguments["user_id"]
-        }
-    )
+    # Requalify the client and get information of the client.
+    client_data = requalify_client(postgresql_connection=postgresql_connection, sql_arguments=input_arguments)
 
     # Define variable that stores formatted information about client.
     client = analyze_and_format_client_data(client_data=client_data)
@@ -62,7 +62,7 @@ def run_multithreading_tasks(functions: List[Dict[AnyStr, Union[Callable, Dict[A
     # Get the results of all threads.
     results = {}
     while not queue.empty():
-        results = {**results, **queue.get()}
+        results.update(queue.get())
 
     # Return the results of all threads.
     return results
@@ -104,7 +104,7 @@ def check_input_arguments(**kwargs) -> None:
 
 def reuse_or_recreate_postgresql_connection(queue: Queue) -> None:
     global POSTGRESQL_CONNECTION
-    if not POSTGRESQL_CONNECTION:
+    if not POSTGRESQL_CONNECTION or POSTGRESQL_CONNECTION.closed:
         try:
             POSTGRESQL_CONNECTION = databases.create_postgresql_connection(
                 POSTGRESQL_USERNAME,
@@ -137,83 +137,7 @@ def postgresql_wrapper(function):
 
 
 @postgresql_wrapper
-def get_aggregated_data(**kwargs) -> Dict[AnyStr, Any]:
-    # Check if the input dictionary has all the necessary keys.
-    try:
-        cursor = kwargs["cursor"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
-    try:
-        sql_arguments = kwargs["sql_arguments"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
-
-    # Prepare the SQL request that returns the aggregated list of IDs by user type.
-    sql_statement = """
-    select
-        array_remove(array_agg(distinct internal_user_id), null)::text[] as internal_users_ids
-    from
-        users
-    where user_id in %(users_ids)s;
-    """
-
-    # Execute the SQL query dynamically, in a convenient and safe way.
-    try:
-        cursor.execute(sql_statement, sql_arguments)
-    except Exception as error:
-        logger.error(error)
-        raise Exception(error)
-
-    # Return the aggregated data.
-    return cursor.fetchone()
-
-
-@postgresql_wrapper
-def update_internal_users(**kwargs) -> None:
-    # Check if the input dictionary has all the necessary keys.
-    try:
-        cursor = kwargs["cursor"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
-    try:
-        sql_arguments = kwargs["sql_arguments"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
-    try:
-        internal_users_ids = sql_arguments["internal_users_ids"]
-    except KeyError as error:
-        logger.error(error)
-        raise Exception(error)
-
-    # Execute the SQL query only if the list is not empty.
-    if internal_users_ids:
-        # Put a tag for deletion for the internal users.
-        sql_statement = """
-        update
-            internal_users
-        set
-            entry_deleted_date_time = null
-        where
-            internal_user_id in %(internal_users_ids)s;
-        """
-
-        # Execute the SQL query dynamically, in a convenient and safe way.
-        try:
-            cursor.execute(sql_statement, sql_arguments)
-        except Exception as error:
-            logger.error(error)
-            raise Exception(error)
-
-    # Return nothing.
-    return None
-
-
-@postgresql_wrapper
-def update_users(**kwargs) -> None:
+def restore_users(**kwargs) -> None:
     # Check if the input dictionary has all the necessary keys.
     try:
         cursor = kwargs["cursor"]
@@ -233,14 +157,24 @@ def update_users(**kwargs) -> None:
 
     # Execute the SQL query only if the list is not empty.
     if users_ids:
-        # Put a tag for deletion for the users.
+        # Remove the tag for deletion from the users and from the internal users linked to them in one statement.
         sql_statement = """
+        with restored_users as (
+            update
+                users
+            set
+                entry_deleted_date_time = null
+            where
+                user_id = any(%(users_ids)s::uuid[])
+            returning
+                internal_user_id
+        )
         update
-            users
+            internal_users
         set
             entry_deleted_date_time = null
         where
-            user_id in %(users_ids)s;
+            internal_user_id in (select internal_user_id from restored_users);
         """
 
         # Execute the SQL query dynamically, in a convenient and safe way.
@@ -280,38 +214,13 @@ def lambda_handler(event, context):
     # Define the instances of the database connections.
     postgresql_connection = results_of_tasks["postgresql_connection"]
 
-    # Get the aggregated data.
-    aggregated_data = get_aggregated_data(
+    # Restore the users and the internal users.
+    restore_users(
         postgresql_connection=postgresql_connection,
         sql_arguments={
-            "users_ids": tuple(users_ids)
+            "users_ids": users_ids
         }
     )
 
-    # Define several variables that will be used in the future.
-    internal_users_ids = aggregated_data.get("internal_users_ids", [])
-
-    # Run several initialization functions in parallel.
-    run_multithreading_tasks([
-        {
-            "function_object": update_internal_users,
-            "function_arguments": {
-                "postgresql_connection": postgresql_connection,
-                "sql_arguments": {
-                    "internal_users_ids": tuple(internal_users_ids)
-                }
-            }
-        },
-        {
-            "function_object": update_users,
-            "function_arguments": {
-                "postgresql_connection": postgresql_connection,
-                "sql_arguments": {
-                    "users_ids": tuple(users_ids)
-                }
-            }
-        }
-    ])
-
     # Return the list of user ids as the response.
     return users_ids